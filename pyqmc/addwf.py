@@ -19,28 +19,67 @@ class AddWF:
             + sum([isinstance(c, complex) * 1 for c in coeffs])
         )
         self.dtype = complex if self.iscomplex else float
+        self._cache = None
+
+    def _sign(self, wf_val):
+        """
+        Phase of a real or complex wave function value: np.sign for real values, and a
+        multiplication by 1/|z| instead of a complex division for complex ones.
+        """
+        if self.iscomplex:
+            return wf_val * np.reciprocal(np.abs(wf_val))
+        return np.sign(wf_val)
+
+    def _set_cache(self, results):
+        r"""
+        Combine the component values into psi(R) and store the sign, the value,
+        and the ratios :math:`c_i \psi_i(R)/\psi(R)`. These are reused until the next update,
+        and value(), recompute() and ratio_current_config() hand them out without copying,
+        so they are made read-only.
+
+        Args:
+          results: list of (sign, ln|psi_i|) for each component
+        """
+        nconf = results[0][1].shape[0]
+        signs = np.empty((len(results), nconf), dtype=self.dtype)
+        logvals = np.empty((len(results), nconf))
+        for i, (sign, logval) in enumerate(results):
+            # complex wave functions can return ln|psi_i| with a complex dtype (e.g. MultiplyWF
+            # stacks it with the complex sign); the value itself is real
+            signs[i], logvals[i] = sign, np.real(logval)
+
+        # c_i psi_i(R) scaled by exp(-ref); psi(R) is their sum, and the ratios
+        # c_i psi_i/psi are the same terms normalized by it, so only one exp is needed.
+        ref = np.amax(logvals, axis=0)
+        terms = signs * np.exp(logvals - ref)
+        terms *= np.asarray(self.coeffs)[:, np.newaxis]
+        wf_val = terms.sum(axis=0)
+        terms /= wf_val
+        wf_sign = self._sign(wf_val)
+        wf_val = np.log(np.abs(wf_val)) + ref
+        for cached in (wf_sign, wf_val, terms):
+            cached.flags.writeable = False
+        self._cache = wf_sign, wf_val, terms
+
+    def _recompute_cache(self):
+        self._set_cache([wf.value() for wf in self.wf_components])
 
     def recompute(self, configs):
         """
         Recompute the quantity :math:`ln(|\psi(R)|)` and the phase/sign of the wave function.
         """
-        wf_vals = np.array([wf.recompute(configs) for wf in self.wf_components])
-        ref = np.amax(wf_vals[:, 1, :]).real
-        wf_val = np.einsum(
-            "i,ij,ij->j", self.coeffs, wf_vals[:, 0, :], np.exp(wf_vals[:, 1, :] - ref)
-        )
-        wf_sign = wf_val / np.abs(wf_val)
-        wf_val = np.log(np.abs(wf_val)) + ref
-        return wf_sign, wf_val
+        self._set_cache([wf.recompute(configs) for wf in self.wf_components])
+        return self._cache[0], self._cache[1]
 
     def updateinternals(self, e, epos, configs, mask=None, saved_values=None):
         """
         Update the electron e position to epos, for each wf component in self.wf_components
         """
         if saved_values is None:
-            saved_values = [None] * len(self.wf_factors)
+            saved_values = [None] * len(self.wf_components)
         for wf, saved in zip(self.wf_components, saved_values):
             wf.updateinternals(e, epos, configs, mask=mask, saved_values=saved)
+        self._cache = None
 
     def value(self):
         """
@@ -49,14 +88,9 @@ class AddWF:
         Returns:
           phase/sign of the wave function psi(R), the value ln|psi(R)|
         """
-        wf_vals = np.array([wf.value() for wf in self.wf_components])
-        ref = np.amax(wf_vals[:, 1, :]).real
-        wf_val = np.einsum(
-            "i,ij,ij->j", self.coeffs, wf_vals[:, 0, :], np.exp(wf_vals[:, 1, :] - ref)
-        )
-        wf_sign = wf_val / np.abs(wf_val)
-        wf_val = np.log(np.abs(wf_val)) + ref
-        return wf_sign, wf_val
+        if self._cache is None:
+            self._recompute_cache()
+        return self._cache[0], self._cache[1]
 
     def ratio_current_config(self, mask=None):
         """
@@ -68,23 +102,12 @@ class AddWF:
         Returns:
           ratio c*psi_i(R)/psi(R)
         """
-        wf_vals = np.array([wf.value() for wf in self.wf_components])
-        ref = np.amax(wf_vals[:, 1, :], axis=0).real
-        wf_val = np.einsum(
-            "i,ij,ij->j", self.coeffs, wf_vals[:, 0, :], np.exp(wf_vals[:, 1, :] - ref)
-        )
+        if self._cache is None:
+            self._recompute_cache()
+        ratio = self._cache[2]
         if mask is None:
-            mask = np.ones(wf_val.shape[0], dtype=bool)
-
-        wf_sign = wf_val / np.abs(wf_val)
-        wf_val = np.log(np.abs(wf_val)) + ref
-        ratio = np.einsum(
-            "i,i...j,i...j->i...j",
-            self.coeffs,
-            wf_vals[:, 0, mask] / wf_sign[mask],
-            np.exp(wf_vals[:, 1, mask] - wf_val[mask]),
-        )
-        return ratio
+            return ratio
+        return ratio[:, mask]
 
     def ratio(self, e, epos, mask=None):
         """
@@ -98,31 +121,21 @@ class AddWF:
         Returns:
           ratio c*psi_i(R')/psi(R')
         """
-        wf_vals = np.array([wf.value() for wf in self.wf_components])
-        ref = np.amax(wf_vals[:, 1, :]).real
-        wf_val = np.einsum(
-            "i,ij,ij->j", self.coeffs, wf_vals[:, 0, :], np.exp(wf_vals[:, 1, :] - ref)
+        testvals = np.array(
+            [wf.testvalue(e, epos, mask)[0] for wf in self.wf_components]
         )
-        wf_sign = wf_val / np.abs(wf_val)
-        wf_val = np.log(np.abs(wf_val)) + ref
-        testvals = [wf.testvalue(e, epos, mask)[0] for wf in self.wf_components]
-        ratio = np.einsum(
-            "i,i...j,i...j,ij->i...j",
-            self.coeffs,
-            wf_vals[:, 0, mask] / wf_sign,
-            np.exp(wf_vals[:, 1, mask] - wf_val),
-            testvals / self.testvalue(e, epos, mask)[0],
-        )
-        if ratio.shape[1] == 1:
-            ratio = np.squeeze(ratio)
-        return ratio
+        ratio = self.ratio_current_config(mask) * testvals
+        return ratio / np.sum(ratio, axis=0)
 
     def gradient(self, e, epos):
         """
         Compute the gradient of the log wave function, which is the quantity :math:`\nabla_e \psi/\psi|_{R'}`.
         """
-        grads_components = np.array([wf.gradient(e, epos) for wf in self.wf_components])
-        return np.einsum("ijk,ik->jk", grads_components, self.ratio(e, epos))
+        ratio = self.ratio(e, epos)
+        grad = self.wf_components[0].gradient(e, epos) * ratio[0]
+        for wf, r in zip(self.wf_components[1:], ratio[1:]):
+            grad += wf.gradient(e, epos) * r
+        return grad
 
     def testvalue(self, e, epos, mask=None):
         """
@@ -131,26 +144,22 @@ class AddWF:
         testvalue_components, saved_values = list(
             zip(*[wf.testvalue(e, epos, mask=mask) for wf in self.wf_components])
         )
-        return (
-            np.einsum(
-                "ij...,ij->j...",
-                np.array(testvalue_components),
-                self.ratio_current_config(mask),
-            ),
-            saved_values,
-        )
+        ratio = self.ratio_current_config(mask)
+        ratio = ratio.reshape(ratio.shape + (1,) * (testvalue_components[0].ndim - 1))
+        val = testvalue_components[0] * ratio[0]
+        for tv, r in zip(testvalue_components[1:], ratio[1:]):
+            val += tv * r
+        return val, saved_values
 
     def testvalue_many(self, e, epos, mask=None):
         """
         Compute the ratio :math:`\psi(R')/\psi(R)`, where R' is the configuration when electron e's position is replaced by epos for each electron.
         """
-        testvalue_components = np.array(
-            [wf.testvalue_many(e, epos, mask=mask) for wf in self.wf_components]
-        )
-
-        return np.einsum(
-            "ijk,ij->jk", testvalue_components, self.ratio_current_config(mask)
-        )
+        ratio = self.ratio_current_config(mask)[..., np.newaxis]
+        val = self.wf_components[0].testvalue_many(e, epos, mask=mask) * ratio[0]
+        for wf, r in zip(self.wf_components[1:], ratio[1:]):
+            val += wf.testvalue_many(e, epos, mask=mask) * r
+        return val
 
     def gradient_value(self, e, epos):
         """
@@ -158,9 +167,14 @@ class AddWF:
         """
         grad_vals = [wf.gradient_value(e, epos) for wf in self.wf_components]
         grads, vals, saved_values = list(zip(*grad_vals))
-        ratio = self.ratio(e, epos)
-        grad = np.einsum("ijk,ik->jk", grads, ratio)
-        val = np.einsum("ij,ij->j", vals, self.ratio_current_config())
+        ratio = self.ratio_current_config()
+        val = vals[0] * ratio[0]
+        grad = grads[0] * val
+        for g, v, r in zip(grads[1:], vals[1:], ratio[1:]):
+            rv = v * r
+            val += rv
+            grad += g * rv
+        grad /= val
         return grad, val, saved_values
 
     def gradient_laplacian(self, e, epos):
@@ -170,24 +184,30 @@ class AddWF:
         grad_laps = [wf.gradient_laplacian(e, epos) for wf in self.wf_components]
         grads, laps = list(zip(*grad_laps))
         ratio = self.ratio(e, epos)
-        return np.einsum("ijk,ik->jk", grads, ratio), np.einsum("ij,ij->j", laps, ratio)
+        grad = grads[0] * ratio[0]
+        lap = laps[0] * ratio[0]
+        for g, l, r in zip(grads[1:], laps[1:], ratio[1:]):
+            grad += g * r
+            lap += l * r
+        return grad, lap
 
     def laplacian(self, e, epos):
         """
         Compute the laplacian of psi over psi
         """
-        laps = [wf.laplacian(e, epos) for wf in self.wf_components]
-        return np.einsum("ij,ij->j", laps, self.ratio(e, epos))
+        ratio = self.ratio(e, epos)
+        lap = self.wf_components[0].laplacian(e, epos) * ratio[0]
+        for wf, r in zip(self.wf_components[1:], ratio[1:]):
+            lap += wf.laplacian(e, epos) * r
+        return lap
 
     def pgradient(self):
         """
         Compute the gradient of the parameters
         """
         ratio = self.ratio_current_config()
-        pgrad = []
-        for iwf, wf in enumerate(self.wf_components):
-            pgrad_tmp = wf.pgradient()
-            for k in wf.pgradient().keys():
-                pgrad_tmp[k] = np.einsum("i...,i->i...", pgrad_tmp[k], ratio[iwf, :])
-            pgrad.append(pgrad_tmp)
+        pgrad = [wf.pgradient() for wf in self.wf_components]
+        for r, pgrad_tmp in zip(ratio, pgrad):
+            for k, v in pgrad_tmp.items():
+                pgrad_tmp[k] = v * r.reshape(r.shape + (1,) * (v.ndim - 1))
         return Parameters(pgrad)
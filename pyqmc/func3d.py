@@ -19,8 +19,44 @@ laplacian(x)
 
 pgradient(x)
     returns dp f(x) as a dictionary corresponding to the keys of self.parameters
+
+The constructors take an optional precision="single" or "double" (default). In single
+precision, value() converts its inputs and the parameters to float32 and returns float32.
+JastrowSpin builds its log value from value() (recompute, the stored partial sums and
+testvalue/testvalue_many), so with single precision basis functions everything that
+depends on the Jastrow value is only accurate to float32: Metropolis acceptance, DMC
+weights, linemin reweighting and the ECP ratios in the local energy.
+The derivative methods (gradient, gradient_value, laplacian, gradient_laplacian and
+pgradient) ignore the precision setting and return arrays of the input dtype, because in
+float32 the finite-difference error of PolyPadeFunction's gradient and laplacian grows to
+~1e-2. In particular gradient_value() returns the value in the input precision, which can
+differ from value() on a single precision instance.
 """
 
+try:
+    import numexpr as ne
+except ModuleNotFoundError:
+    ne = None
+
+try:
+    import numba
+except ModuleNotFoundError:
+    numba = None
+
+# numexpr and numba only work on host arrays, so they are skipped when running on the GPU
+on_gpu = gpu.cp is not np
+use_numexpr = ne is not None and not on_gpu
+use_numba = numba is not None and not on_gpu
+# below this many elements numexpr's dispatch overhead outweighs its gain over numpy
+numexpr_min_size = 10000
+
+precision_dtypes = {"single": np.float32, "double": np.float64}
+
+
+def _cast(dtype, *arrays):
+    """Converts arrays (inputs or parameters) to dtype; a no-op when they already match."""
+    return [gpu.cp.asarray(a, dtype=dtype) for a in arrays]
+
 
 class GaussianFunction:
     r"""A representation of a Gaussian:
@@ -30,7 +66,8 @@ class GaussianFunction:
 
     """
 
-    def __init__(self, exponent):
+    def __init__(self, exponent, precision="double"):
+        self.dtype = precision_dtypes[precision]
         self.parameters = {"exponent": exponent}
 
     def value(self, x, r):
@@ -41,7 +78,8 @@ class GaussianFunction:
         :returns: function value
         :rtype: (nconfig,...) array
         """
-        return np.exp(-self.parameters["exponent"] * r * r)
+        r, alpha = _cast(self.dtype, r, self.parameters["exponent"])
+        return np.exp(-alpha * r * r)
 
     def gradient(self, x, r):
         """Returns gradient of function.
@@ -51,8 +89,9 @@ class GaussianFunction:
         :returns: gradient
         :rtype: (nconfig,...,3)
         """
-        v = self.value(x, r)
-        return -2 * self.parameters["exponent"] * x * v[..., np.newaxis]
+        alpha = self.parameters["exponent"]
+        v = np.exp(-alpha * r * r)
+        return -2 * alpha * x * v[..., np.newaxis]
 
     def gradient_value(self, x, r):
         """
@@ -61,8 +100,9 @@ class GaussianFunction:
         :returns: gradient and value
         :rtype: tuple of (nconfig,...,3) arrays
         """
-        v = self.value(x, r)
-        g = -2 * self.parameters["exponent"] * x * v[..., np.newaxis]
+        alpha = self.parameters["exponent"]
+        v = np.exp(-alpha * r * r)
+        g = -2 * alpha * x * v[..., np.newaxis]
         return g, v
 
     def laplacian(self, x, r):
@@ -73,8 +113,8 @@ class GaussianFunction:
         :returns: laplacian (components of laplacian d^2/dx_i^2 separately)
         :rtype: (nconfig,...,3)
         """
-        v = self.value(x, r)
         alpha = self.parameters["exponent"]
+        v = np.exp(-alpha * r * r)
         return (4 * alpha * alpha * x * x - 2 * alpha) * v[..., np.newaxis]
 
     def gradient_laplacian(self, x, r):
@@ -85,8 +125,8 @@ class GaussianFunction:
         :returns: gradient and laplacian
         :rtype: tuple of two (nconfig,...,3) arrays (components of laplacian d^2/dx_i^2 separately)
         """
-        v = self.value(x, r)[..., np.newaxis]
         alpha = self.parameters["exponent"]
+        v = np.exp(-alpha * r * r)[..., np.newaxis]
         grad = -2 * alpha * x * v
         lap = (4 * alpha * alpha * x * x - 2 * alpha) * v
         return grad, lap
@@ -113,9 +153,15 @@ class PadeFunction:
     :math:`\alpha_k = \frac{\alpha}{2^k}`, :math:`k` starting at 0
     """
 
-    def __init__(self, alphak):
+    def __init__(self, alphak, precision="double"):
+        self.dtype = precision_dtypes[precision]
         self.parameters = {"alphak": alphak}
 
+    def _kernel(self, r):
+        """Returns a = alphak*r and 1/(1+a), shared by all the evaluation methods."""
+        a = self.parameters["alphak"] * r
+        return a, 1 / (1 + a)
+
     def value(self, rvec, r):
         """
         :parameter rvec: (nconfig,...,3)
@@ -123,8 +169,11 @@ class PadeFunction:
         :returns: function value
         :rtype: (nconfig,...) array
         """
-        a = self.parameters["alphak"] * r
-        return (a / (1 + a)) ** 2
+        r, alphak = _cast(self.dtype, r, self.parameters["alphak"])
+        a = alphak * r
+        aoopa = a / (1 + a)
+        aoopa *= aoopa
+        return aoopa
 
     def gradient(self, rvec, r):
         """
@@ -133,8 +182,9 @@ class PadeFunction:
         :returns: gradient
         :rtype: (nconfig,...,3) array
         """
-        a = self.parameters["alphak"] * r[..., np.newaxis]
-        return 2 * self.parameters["alphak"] ** 2 / (1 + a) ** 3 * rvec
+        a, oopa = self._kernel(r)
+        temp = 2 * self.parameters["alphak"] ** 2 * oopa * oopa * oopa
+        return temp[..., np.newaxis] * rvec
 
     def gradient_value(self, rvec, r):
         """
@@ -143,10 +193,11 @@ class PadeFunction:
         :returns: gradient and value
         :rtype: tuple of (nconfig,...,3) arrays
         """
-        a = self.parameters["alphak"] * r
-        value = (a / (1 + a)) ** 2
-        a = a[..., np.newaxis]
-        grad = 2 * self.parameters["alphak"] ** 2 / (1 + a) ** 3 * rvec
+        a, oopa = self._kernel(r)
+        aoopa = a * oopa
+        value = aoopa * aoopa
+        temp = 2 * self.parameters["alphak"] ** 2 * oopa * oopa * oopa
+        grad = temp[..., np.newaxis] * rvec
         return grad, value
 
     def laplacian(self, rvec, r):
@@ -156,14 +207,15 @@ class PadeFunction:
         :returns: laplacian (returns components of laplacian d^2/dx_i^2 separately)
         :rtype: (nconfig,...,3) array
         """
-        a = self.parameters["alphak"] * r[..., np.newaxis]
-        # lap = 6*self.parameters['alphak']**2 * (1+a)**(-4) #scalar formula
-        lap = (
-            2
-            * self.parameters["alphak"] ** 2
-            * (1 + a) ** (-3)
-            * (1 - 3 * a / (1 + a) * (rvec / r[..., np.newaxis]) ** 2)
-        )
+        a, oopa = self._kernel(r)
+        temp = 2 * self.parameters["alphak"] ** 2 * oopa * oopa * oopa
+        h = a * temp
+        h *= oopa
+        h /= r * r
+        h *= -3
+        lap = rvec * rvec
+        lap *= h[..., np.newaxis]
+        lap += temp[..., np.newaxis]
         return lap
 
     def gradient_laplacian(self, rvec, r):
@@ -174,10 +226,18 @@ class PadeFunction:
         :returns: gradient and laplacian (returns components of laplacian d^2/dx_i^2 separately)
         :rtype: tuple of (nconfig,...,3) arrays
         """
-        a = self.parameters["alphak"] * r[..., np.newaxis]
-        temp = 2 * self.parameters["alphak"] ** 2 / (1 + a) ** 3
+        # lap = 6*self.parameters['alphak']**2 * (1+a)**(-4) #scalar formula
+        a, oopa = self._kernel(r)
+        temp = 2 * self.parameters["alphak"] ** 2 * oopa * oopa * oopa
+        h = a * temp
+        h *= oopa
+        h /= r * r
+        h *= -3
+        temp = temp[..., np.newaxis]
         grad = temp * rvec
-        lap = temp * (1 - 3 * a / (1 + a) * (rvec / r[..., np.newaxis]) ** 2)
+        lap = rvec * rvec
+        lap *= h[..., np.newaxis]
+        lap += temp
         return grad, lap
 
     def pgradient(self, rvec, r):
@@ -188,15 +248,14 @@ class PadeFunction:
         :returns: parameter gradient  {'alphak': akderiv}
         :rtype: dictionary
         """
-        a = self.parameters["alphak"] * r
-        akderiv = 2 * a / (1 + a) ** 3 * r
+        a, oopa = self._kernel(r)
+        akderiv = 2 * a * oopa * oopa * oopa * r
         return {"alphak": akderiv}
 
 
 @gpu.fuse()
 def polypadevalue(z, beta):
-    z2 = z * z
-    p = z2 * (6 - 8 * z + 3 * z2)
+    p = ((3 * z - 8) * z + 6) * z * z
     return (1 - p) / (1 + beta * p)
 
 
@@ -204,17 +263,76 @@ def polypadevalue(z, beta):
 def polypadegradvalue(r, beta, rcut):
     z = r / rcut
     z1 = z - 1
-    z12 = z1 * z1
-    p = (3 * z12 + 4 * z1) * z12 + 1
+    p = ((3 * z - 8) * z + 6) * z * z
     obp = 1 / (1 + beta * p)
-    dpdz = 12 * z * (z * z - 2 * z + 1)
+    dpdz = 12 * z * z1 * z1
     dbdp = -(1 + beta) * obp * obp
     dzdx_rvec = 1 / (r * rcut)
     grad_rvec = dbdp * dpdz * dzdx_rvec
-    value = (1 - p)  * obp
+    value = (1 - p) * obp
     return grad_rvec, value
 
 
+if on_gpu:
+    polypade_gradient_laplacian_gpu = gpu.cp.ElementwiseKernel(
+        "T rvec, T r, T rcut, T beta",
+        "T grad, T lap",
+        """
+        if (r >= rcut) {
+            grad = 0;
+            lap = 0;
+        } else {
+            T z = r / rcut;
+            T z1 = z - 1;
+            T p = ((3 * z - 8) * z + 6) * z * z;
+            T obp = 1 / (1 + beta * p);
+            T dpdz = 12 * z * z1 * z1;
+            T dbdp = -(1 + beta) * obp * obp;
+            T rinv = 1 / r;
+            T orrcut = rinv / rcut;
+            T dzdx = rvec * orrcut;
+            T rhat = rvec * rinv;
+            T d2zdx2 = (1 - rhat * rhat) * orrcut;
+            grad = dbdp * dpdz * dzdx;
+            lap = dbdp * dpdz * d2zdx2
+                + grad * dzdx * (-2 * beta * obp * dpdz + (3 * z - 1) / (z * z1));
+        }
+        """,
+        "polypade_gradient_laplacian",
+    )
+
+
+if numba is not None:
+
+    # No signatures are given, so each dtype is compiled on first use (and cached on disk)
+    # rather than at import; the caller therefore has to pass the outputs in.
+    @numba.guvectorize("(n),(),(),()->(n),(n)", target="cpu", cache=True)
+    def polypade_gradient_laplacian(rvec, r, rcut, beta, grad, lap):
+        if r >= rcut:
+            grad[:] = 0.0
+            lap[:] = 0.0
+            return
+        z = r / rcut
+        z1 = z - 1
+        p = ((3 * z - 8) * z + 6) * z * z
+        obp = 1 / (1 + beta * p)
+        dpdz = 12 * z * z1 * z1
+        dbdp = -(1 + beta) * obp * obp
+        d2pdz2_over_dpdz = (3 * z - 1) / (z * z1)
+        d2bdp2_over_dbdp = -2 * beta * obp
+        rinv = 1 / r
+        orrcut = rinv / rcut
+        for i in range(rvec.shape[0]):
+            dzdx = rvec[i] * orrcut
+            rhat = rvec[i] * rinv
+            d2zdx2 = (1 - rhat * rhat) * orrcut
+            g = dbdp * dpdz * dzdx
+            grad[i] = g
+            lap[i] = dbdp * dpdz * d2zdx2 + g * dzdx * (
+                d2bdp2_over_dbdp * dpdz + d2pdz2_over_dpdz
+            )
+
+
 class PolyPadeFunction:
     r"""
     :math:`b(r) = \frac{1-p(z)}{1+\beta p(z)}`
@@ -225,12 +343,23 @@ class PolyPadeFunction:
     This function is positive at small r, and is zero for :math:`r \ge r_{\rm cut}`.
     """
 
-    def __init__(self, beta, rcut):
+    def __init__(self, beta, rcut, precision="double"):
+        self.dtype = precision_dtypes[precision]
         self.parameters = {
             "beta": gpu.cp.asarray(beta),
             "rcut": gpu.cp.asarray(rcut),
         }
 
+    def _kernel(self, z):
+        """Returns p(z), 1/(1+beta*p), dp/dz and db/dp, shared by the evaluation methods."""
+        z1 = z - 1
+        beta = self.parameters["beta"]
+        p = ((3 * z - 8) * z + 6) * z * z
+        obp = 1 / (1 + beta * p)
+        dpdz = 12 * z * z1 * z1
+        dbdp = -(1 + beta) * obp * obp
+        return p, obp, dpdz, dbdp
+
     def value(self, rvec, r):
         """Returns function (1-p(r/rcut))/(1+beta*p(r/rcut))
 
@@ -239,10 +368,19 @@ class PolyPadeFunction:
         :returns: function value
         :rtype: (nconfig,...) array
         """
-        mask = r < self.parameters["rcut"]
-        z = r[mask] / self.parameters["rcut"]
-        func = gpu.cp.zeros(r.shape)
-        func[mask] = polypadevalue(z, self.parameters["beta"])
+        r, beta, rcut = _cast(
+            self.dtype, r, self.parameters["beta"], self.parameters["rcut"]
+        )
+        if use_numexpr and r.size >= numexpr_min_size:
+            z = r / rcut
+            return ne.evaluate(
+                "where(z < 1, (1 - ((3*z - 8)*z + 6)*z*z)"
+                " / (1 + beta*((3*z - 8)*z + 6)*z*z), 0)"
+            )
+        mask = r < rcut
+        z = r[mask] / rcut
+        func = gpu.cp.zeros(r.shape, dtype=self.dtype)
+        func[mask] = polypadevalue(z, beta)
         return func
 
     def gradient_value(self, rvec, r):
@@ -252,8 +390,8 @@ class PolyPadeFunction:
         :returns: gradient and value
         :rtype: tuple of (nconfig,...,3) arrays
         """
-        value = gpu.cp.zeros(r.shape)
-        grad = gpu.cp.zeros(rvec.shape)
+        value = gpu.cp.zeros(r.shape, dtype=r.dtype)
+        grad = gpu.cp.zeros(rvec.shape, dtype=rvec.dtype)
         mask = r < self.parameters["rcut"]
         grad_rvec, value[mask] = polypadegradvalue(
             r[mask],
@@ -270,16 +408,13 @@ class PolyPadeFunction:
         :returns: gradient
         :rtype: (nconfig,...,3) array
         """
-        grad = gpu.cp.zeros(rvec.shape)
+        grad = gpu.cp.zeros(rvec.shape, dtype=rvec.dtype)
         mask = r < self.parameters["rcut"]
-        r = r[mask][..., np.newaxis]
-        rvec = rvec[mask]
+        r = r[mask]
         z = r / self.parameters["rcut"]
-        p = z * z * (6 - 8 * z + 3 * z * z)
-        dpdz = 12 * z * (z * z - 2 * z + 1)
-        dbdp = -(1 + self.parameters["beta"]) / (1 + self.parameters["beta"] * p) ** 2
-        dzdx = rvec / (r * self.parameters["rcut"])
-        grad[mask] = dbdp * dpdz * dzdx
+        p, obp, dpdz, dbdp = self._kernel(z)
+        g = dbdp * dpdz / (r * self.parameters["rcut"])
+        grad[mask] = g[..., np.newaxis] * rvec[mask]
         return grad
 
     def laplacian(self, rvec, r):
@@ -300,30 +435,46 @@ class PolyPadeFunction:
         :returns: gradient and laplacian
         :rtype: tuple of two (nconfig,...,3) arrays (components of laplacian d^2/dx_i^2 separately)
         """
-        grad = gpu.cp.zeros(rvec.shape)
-        lap = gpu.cp.zeros(rvec.shape)
+        if on_gpu:
+            # the kernel takes a single type T, so e.g. an integer rcut must be converted
+            r, rcut, beta = _cast(
+                rvec.dtype, r, self.parameters["rcut"], self.parameters["beta"]
+            )
+            return polypade_gradient_laplacian_gpu(rvec, r[..., np.newaxis], rcut, beta)
+        if use_numba:
+            grad, lap = np.empty_like(rvec), np.empty_like(rvec)
+            polypade_gradient_laplacian(
+                rvec, r, self.parameters["rcut"], self.parameters["beta"], grad, lap
+            )
+            return grad, lap
+        # numpy fallback only (CPU without numba): one zeroed buffer split into grad and lap
+        grad, lap = gpu.cp.zeros((2,) + rvec.shape, dtype=rvec.dtype)
         mask = r < self.parameters["rcut"]
-        r = r[..., np.newaxis]
         r = r[mask]
         rvec = rvec[mask]
-        z = r / self.parameters["rcut"]
-        z1 = z - 1
-        z12 = z1 * z1
-        beta = self.parameters["beta"]
-
-        p = (3 * z12 + 4 * z1) * z12 + 1
-        obp = 1 / (1 + beta * p)
-        dpdz = 12 * z * z12
-        dbdp = -(1 + beta) * obp * obp
-        dzdx = rvec / (r * self.parameters["rcut"])
-        gradmask = dbdp * dpdz * dzdx
-        d2pdz2_over_dpdz = (3 * z - 1) / (z * z1)
-        d2bdp2_over_dbdp = -2 * beta * obp
-        d2zdx2 = (1 - (rvec / r) ** 2) / (r * self.parameters["rcut"])
-        grad[mask] = gradmask
-        lap[mask] += dbdp * dpdz * d2zdx2 + (
-            gradmask * (d2bdp2_over_dbdp * dpdz * dzdx + d2pdz2_over_dpdz * dzdx)
-        )
+        rinv = 1 / r
+        rcutinv = 1 / self.parameters["rcut"]
+        rrcutinv = rinv * rcutinv
+        z = r * rcutinv
+
+        # Per-pair (scalar) factors are computed on r-shaped arrays; rvec is only touched
+        # at the end, with grad_i = g x_i and lap_i = g + h x_i^2.
+        p, obp, dpdz, dbdp = self._kernel(z)
+        d2pdz2_over_dpdz = (3 * z - 1) / (z * (z - 1))
+        d2bdp2_over_dbdp = -2 * self.parameters["beta"] * obp
+        g = dbdp * dpdz * rrcutinv
+        h = d2bdp2_over_dbdp * dpdz
+        h += d2pdz2_over_dpdz
+        h *= rrcutinv
+        h -= rinv * rinv
+        h *= g
+        g = g[..., np.newaxis]
+        grad[mask] = g * rvec
+        # rvec is a masked copy, so it can be overwritten with the laplacian
+        rvec *= rvec
+        rvec *= h[..., np.newaxis]
+        rvec += g
+        lap[mask] = rvec
         return grad, lap
 
     def pgradient(self, rvec, r):
@@ -334,21 +485,16 @@ class PolyPadeFunction:
 
         :return paramderivs: dictionary {'rcut':d/drcut,'beta':d/dbeta}
         """
-        mask = r >= self.parameters["rcut"]
-        z = r / self.parameters["rcut"]
-        z1 = z - 1
-        z12 = z1 * z1
-        beta = self.parameters["beta"]
-
-        p = (3 * z12 + 4 * z1) * z12 + 1
-        obp = 1 / (1 + beta * p)
-        dpdz = 12 * z * z12
-        dbdp = -(1 + beta) * obp * obp
+        # z = 0 outside the cutoff gives p = dp/dz = 0, so both derivatives vanish there
+        z = np.where(r < self.parameters["rcut"], r / self.parameters["rcut"], 0.0)
+        p, obp, dpdz, dbdp = self._kernel(z)
         derivrcut = dbdp * dpdz * (-z / self.parameters["rcut"])
         derivbeta = -p * (1 - p) * obp * obp
-        derivrcut[mask] = 0.0
-        derivbeta[mask] = 0.0
-        pderiv = {"rcut": derivrcut, "beta": derivbeta}
+        # the 0-d parameter arrays promote float32 inputs, so cast back to the input dtype
+        pderiv = {
+            "rcut": derivrcut.astype(r.dtype, copy=False),
+            "beta": derivbeta.astype(r.dtype, copy=False),
+        }
         return pderiv
 
 
@@ -361,9 +507,21 @@ class CutoffCuspFunction:
     This function is positive at small r, and is zero for :math:`r \ge r_{\rm cut}`.
     """
 
-    def __init__(self, gamma, rcut):
+    def __init__(self, gamma, rcut, precision="double"):
+        self.dtype = precision_dtypes[precision]
         self.parameters = {"gamma": gamma, "rcut": rcut}
 
+    def _kernel(self, r):
+        """Returns the mask r < rcut, y-1, (y-1)^2 and 1/(1+gamma*p(y)) with y = r/rcut,
+        shared by the derivative methods; p(y) = ((y-1)^3+1)/3 is left to the callers
+        that need it. Outside the cutoff y is replaced by a dummy value, which keeps the
+        masked-out entries finite."""
+        mask = r < self.parameters["rcut"]
+        y1 = np.where(mask, r / self.parameters["rcut"], 0.5) - 1
+        a = y1 * y1
+        ogb = 1 / (1 + self.parameters["gamma"] * (a * y1 + 1) / 3)
+        return mask, y1, a, ogb
+
     def value(self, rvec, r):
         """Returns function  p(r/rcut)/(1+gamma*p(r/rcut))
 
@@ -372,14 +530,23 @@ class CutoffCuspFunction:
         :returns: function value
         :rtype: (nconfig,...) array
         """
-        mask = r < self.parameters["rcut"]
-        y = r[mask] / self.parameters["rcut"]
-        gamma = self.parameters["gamma"]
-        y1 = y - 1
-        p = (y1 * y1 * y1 + 1) / 3
-        func = gpu.cp.zeros(r.shape)
-        func[mask] = -p / (1 + gamma * p) + 1 / (3 + gamma)
-        return func * self.parameters["rcut"]
+        r, rcut, gamma = _cast(
+            self.dtype, r, self.parameters["rcut"], self.parameters["gamma"]
+        )
+        mask = r < rcut
+        # Only p(y) is needed here, so skip _kernel. Clamping y at 1 keeps p bounded
+        # outside the cutoff, where the mask zeroes the result.
+        y1 = r / rcut
+        y1 -= 1
+        np.minimum(y1, 0, out=y1)
+        p = y1 * y1 * y1
+        p += 1
+        p /= 3
+        func = -p / (1 + gamma * p)
+        func += 1 / (3 + gamma)
+        func *= mask
+        func *= rcut
+        return func
 
     def gradient(self, rvec, r):
         """
@@ -388,20 +555,9 @@ class CutoffCuspFunction:
         :returns: gradient
         :rtype: (nconfig,...,3) array
         """
-        rcut = self.parameters["rcut"]
-        gamma = self.parameters["gamma"]
-        mask = r < rcut
-        r = r[mask][..., np.newaxis]
-        y = r / rcut
-        y1 = y - 1
-
-        a = y1 * y1
-        b = (a * y1 + 1) / 3
-        c = 1 / (1 + gamma * b) ** 2 / (rcut * r)
-
-        grad = gpu.cp.zeros(rvec.shape)
-        grad[mask] = -rvec[mask] * a * c * rcut
-        return grad
+        mask, _, a, ogb = self._kernel(r)
+        g = -a * ogb * ogb * mask / r
+        return g[..., np.newaxis] * rvec
 
     def gradient_value(self, rvec, r):
         """
@@ -410,23 +566,12 @@ class CutoffCuspFunction:
         :returns: gradient and value
         :rtype: tuple of (nconfig,...,3) arrays
         """
-        grad = gpu.cp.zeros(rvec.shape)
-        value = gpu.cp.zeros(r.shape)
         rcut = self.parameters["rcut"]
-        gamma = self.parameters["gamma"]
-        mask = r < rcut
-        r = r[mask][..., np.newaxis]
-        y = r / rcut
-        y1 = y - 1
-
-        a = y1 * y1
+        mask, y1, a, ogb = self._kernel(r)
         b = (a * y1 + 1) / 3
-        ogb = 1 / (1 + gamma * b)
-        c = ogb * ogb / (rcut * r)
-
-        grad[mask] = -rvec[mask] * a * c * rcut
-        value[mask] = -(b * ogb)[..., 0] + 1 / (3 + gamma)
-        return grad, value * rcut
+        g = -a * ogb * ogb * mask / r
+        value = (-b * ogb + 1 / (3 + self.parameters["gamma"])) * mask
+        return g[..., np.newaxis] * rvec, value * rcut
 
     def laplacian(self, rvec, r):
         """
@@ -435,23 +580,22 @@ class CutoffCuspFunction:
         :returns: laplacian (returns components of laplacian d^2/dx_i^2 separately)
         :rtype: (nconfig,...,3) array
         """
-        lap = gpu.cp.zeros(rvec.shape)
         rcut = self.parameters["rcut"]
         gamma = self.parameters["gamma"]
-        mask = r < rcut
-        r = r[mask][..., np.newaxis]
-        rvec = rvec[mask]
-        y = r / rcut
-        y1 = y - 1
-
-        a = y1 * y1
-        b = (a * y1 + 1) / 3
-        c = 1 / (1 + gamma * b) ** 2 / (rcut * r)
-
-        temp = 2 * y1 / (rcut * r)
-        temp -= a / r**2
-        temp -= 2 * a * a * c * gamma * (1 + gamma * b)
-        lap[mask] = -rcut * c * (a + rvec**2 * temp)
+        mask, y1, a, ogb = self._kernel(r)
+        rinv = 1 / r
+        rrcutinv = rinv / rcut
+        c = mask * ogb * ogb
+        c *= rrcutinv
+
+        temp = 2 * y1 * rrcutinv
+        temp -= a * rinv * rinv
+        temp -= 2 * gamma * a * a * ogb * rrcutinv
+        g = -rcut * a * c
+        temp *= -rcut * c
+        lap = rvec * rvec
+        lap *= temp[..., np.newaxis]
+        lap += g[..., np.newaxis]
         return lap
 
     def gradient_laplacian(self, rvec, r):
@@ -462,26 +606,24 @@ class CutoffCuspFunction:
         :returns: gradient and laplacian
         :rtype: tuple of two (nconfig,...,3) arrays (components of laplacian d^2/dx_i^2 separately)
         """
-        grad = gpu.cp.zeros(rvec.shape)
-        lap = gpu.cp.zeros(rvec.shape)
         rcut = self.parameters["rcut"]
         gamma = self.parameters["gamma"]
-        mask = r < rcut
-        r = r[mask][..., np.newaxis]
-        rvec = rvec[mask]
-        y = r / rcut
-        y1 = y - 1
-
-        a = y1 * y1
-        b = (a * y1 + 1) / 3
-        c = 1 / (1 + gamma * b) ** 2 / (rcut * r)
-
-        grad[mask] = -rcut * a * c * rvec
-        temp = 2 * y1 / (rcut * r)
-        temp -= a / r**2
-        temp -= 2 * a * a * c * gamma * (1 + gamma * b)
-        lap[mask] = -rcut * c * (a + rvec**2 * temp)
-        return grad, lap
+        mask, y1, a, ogb = self._kernel(r)
+        rinv = 1 / r
+        rrcutinv = rinv / rcut
+        c = mask * ogb * ogb
+        c *= rrcutinv
+
+        temp = 2 * y1 * rrcutinv
+        temp -= a * rinv * rinv
+        # 2 a^2 c gamma (1 + gamma b), using c (1 + gamma b) = mask ogb / (rcut r)
+        temp -= 2 * gamma * a * a * ogb * rrcutinv
+        g = (-rcut * a * c)[..., np.newaxis]
+        temp *= -rcut * c
+        lap = rvec * rvec
+        lap *= temp[..., np.newaxis]
+        lap += g
+        return g * rvec, lap
 
     def pgradient(self, rvec, r):
         """Returns gradient of self.value with respect to all parameters
@@ -493,37 +635,35 @@ class CutoffCuspFunction:
         """
         rcut = self.parameters["rcut"]
         gamma = self.parameters["gamma"]
-        mask = r > rcut
-        y = r / rcut
-        y1 = y - 1
+        mask, y1, a, ogb = self._kernel(r)
+        bogb = (a * y1 + 1) / 3 * ogb
+        val = -bogb + 1 / (3 + gamma)
 
-        a = y1 * y1
-        b = (a * y1 + 1) / 3
-        ogb = 1 / (1 + gamma * b)
-        c = a * ogb * ogb / (rcut * r)
-        val = -b * ogb + 1 / (3 + gamma)
-
-        dfdrcut = y * a * ogb * ogb + val
-        dfdgamma = ((b * ogb) ** 2 - 1 / (3 + gamma) ** 2) * rcut
-        dfdrcut[mask] = 0.0
-        dfdgamma[mask] = 0.0
+        dfdrcut = ((y1 + 1) * a * ogb * ogb + val) * mask
+        dfdgamma = (bogb * bogb - 1 / (3 + gamma) ** 2) * rcut * mask
         func = {"rcut": dfdrcut, "gamma": dfdgamma}
 
         return func
 
 
+def _displace(rvec, delta):
+    """Returns rvec displaced by +delta and -delta along each direction.
+
+    :parameter rvec: (nconfig,...,3)
+    :returns: displaced positions; index [0, d] is +delta along d and [1, d] is -delta
+    :rtype: (2,3,nconfig,...,3) array
+    """
+    shift = delta * gpu.cp.eye(3).reshape((3,) + (1,) * (rvec.ndim - 1) + (3,))
+    return rvec + gpu.cp.stack([shift, -shift])
+
+
 def test_func3d_gradient(bf, delta=1e-5):
     rvec = gpu.cp.asarray(np.random.randn(150, 5, 10, 3))  # Internal indices irrelevant
     r = np.linalg.norm(rvec, axis=-1)
     grad = bf.gradient(rvec, r)
-    numeric = gpu.cp.zeros(rvec.shape)
-    for d in range(3):
-        pos = rvec.copy()
-        pos[..., d] += delta
-        plusval = bf.value(pos, np.linalg.norm(pos, axis=-1))
-        pos[..., d] -= 2 * delta
-        minuval = bf.value(pos, np.linalg.norm(pos, axis=-1))
-        numeric[..., d] = (plusval - minuval) / (2 * delta)
+    pos = _displace(rvec, delta)
+    val = bf.value(pos, np.linalg.norm(pos, axis=-1))
+    numeric = np.moveaxis((val[0] - val[1]) / (2 * delta), 0, -1)
     maxerror = np.max(np.abs(grad - numeric))
     return gpu.asnumpy(maxerror)
 
@@ -532,16 +672,10 @@ def test_func3d_laplacian(bf, delta=1e-5):
     rvec = gpu.cp.asarray(np.random.randn(150, 5, 10, 3))  # Internal indices irrelevant
     r = np.linalg.norm(rvec, axis=-1)
     lap = bf.laplacian(rvec, r)
-    numeric = gpu.cp.zeros(rvec.shape)
-    for d in range(3):
-        pos = rvec.copy()
-        pos[..., d] += delta
-        r = np.linalg.norm(pos, axis=-1)
-        plusval = bf.gradient(pos, r)[..., d]
-        pos[..., d] -= 2 * delta
-        r = np.linalg.norm(pos, axis=-1)
-        minuval = bf.gradient(pos, r)[..., d]
-        numeric[..., d] = (plusval - minuval) / (2 * delta)
+    pos = _displace(rvec, delta)
+    grad = bf.gradient(pos, np.linalg.norm(pos, axis=-1))
+    # d/dx_d of the d component of the gradient
+    numeric = np.diagonal((grad[0] - grad[1]) / (2 * delta), axis1=0, axis2=-1)
     maxerror = np.max(np.abs(lap - numeric))
     return gpu.asnumpy(maxerror)
 
@@ -36,6 +36,70 @@ def test_func3d(func, delta=1e-6, epsilon=1e-5):
         assert v < epsilon, (func, k, v)
 
 
+@pytest.mark.parametrize(
+    "cls,args",
+    [
+        (func3d.PadeFunction, (0.2,)),
+        (func3d.PolyPadeFunction, (2.0, 1.5)),
+        (func3d.CutoffCuspFunction, (2.0, 1.5)),
+        (func3d.GaussianFunction, (0.4,)),
+    ],
+)
+def test_func3d_single_precision(cls, args):
+    """
+    Ensure that single precision values are float32 and agree with double precision,
+    and that the derivatives keep the dtype of their inputs
+    """
+    single, double = cls(*args, precision="single"), cls(*args)
+    rvec = np.random.randn(150, 10, 3)
+    r = np.linalg.norm(rvec, axis=-1)
+    s, d = single.value(rvec, r), double.value(rvec, r)
+    assert s.dtype == np.float32
+    assert np.allclose(s, d, rtol=1e-4, atol=1e-4)
+    for name in ["gradient", "laplacian"]:
+        s = getattr(single, name)(rvec, r)
+        assert s.dtype == np.float64, name
+        assert np.allclose(s, getattr(double, name)(rvec, r)), name
+    rvec32, r32 = rvec.astype(np.float32), r.astype(np.float32)
+    derivs = [single.gradient(rvec32, r32), single.laplacian(rvec32, r32)]
+    derivs += [*single.gradient_value(rvec32, r32)]
+    derivs += [*single.gradient_laplacian(rvec32, r32)]
+    derivs += list(single.pgradient(rvec32, r32).values())
+    for x in derivs:
+        assert x.dtype == np.float32
+
+
+@pytest.mark.parametrize("dtype", [np.float64, np.float32])
+@pytest.mark.parametrize(
+    "flag,module", [("use_numba", "numba"), ("use_numexpr", "numexpr")]
+)
+def test_func3d_accelerated(flag, module, dtype, monkeypatch):
+    """
+    Ensure that the optional numba/numexpr paths of PolyPadeFunction (the only class that
+    has them) agree with the plain numpy ones, including the dtype of the results
+    """
+    pytest.importorskip(module)
+    if func3d.on_gpu:
+        pytest.skip("numba and numexpr are not used on the GPU")
+    func = func3d.PolyPadeFunction(2.0, 1.5)
+    # large enough to take the numexpr branch
+    rvec = np.random.randn(1500, 10, 3).astype(dtype)
+    r = np.linalg.norm(rvec, axis=-1)
+    results = {}
+    for on in [False, True]:
+        monkeypatch.setattr(func3d, flag, on)
+        names = ["value", "gradient", "laplacian"]
+        results[on] = [getattr(func, name)(rvec, r) for name in names]
+        results[on] += [
+            *func.gradient_value(rvec, r),
+            *func.gradient_laplacian(rvec, r),
+        ]
+        results[on] += list(func.pgradient(rvec, r).values())
+    for ref, fast in zip(results[False], results[True]):
+        assert fast.dtype == ref.dtype
+        assert np.allclose(ref, fast, rtol=1e-5, atol=1e-5)
+
+
 def test_cutoff_cusp():
     # Check CutoffCusp does not diverge at r/rcut = 1
     gamma = 2.0
@@ -48,9 +112,12 @@ def test_cutoff_cusp():
     g = basis.gradient(rvec, r)
     l = basis.laplacian(rvec, r)
     g_both, l_both = basis.gradient_laplacian(rvec, r)
+    pgrad = basis.pgradient(rvec, r)
 
     assert abs(v).sum() == 0
     assert abs(g).sum() == 0
     assert abs(l).sum() == 0
     assert abs(g_both).sum() == 0
     assert abs(l_both).sum() == 0
+    for k, v in pgrad.items():
+        assert abs(v).sum() == 0, k
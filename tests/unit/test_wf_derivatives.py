@@ -1,11 +1,13 @@
+import copy
 import numpy as np
+import pytest
 import pyqmc.testwf as testwf
 from pyqmc.gpu import cp, asnumpy
 from pyqmc.slater import Slater
 from pyqmc.multiplywf import MultiplyWF
 from pyqmc.addwf import AddWF
 from pyqmc.j3 import J3
-from pyqmc.wftools import generate_jastrow
+from pyqmc.wftools import generate_jastrow, generate_wf
 import pyqmc.api as pyq
 
 def run_tests(wf, epos, epsilon):
@@ -201,3 +203,18 @@ def test_superpose_wf(
     wf = AddWF(coeffs, wfs)
     configs = pyq.initial_guess(mol, nconf)
     run_tests(wf, configs, epsilon)
+
+
+@pytest.mark.filterwarnings("error:Casting complex values to real")
+def test_superpose_wf_complex(H2_ccecp_rhf, epsilon=1e-5, nconf=10):
+    """
+    This test makes sure that the superposewf passes all the wftests when one of the components is complex.
+    """
+    mol, mf = H2_ccecp_rhf
+    mf_complex = copy.copy(mf)
+    mf_complex.mo_coeff = mf.mo_coeff * np.exp(0.3j)
+    wfs = [generate_wf(mol, mf)[0], generate_wf(mol, mf_complex)[0]]
+    wf = AddWF([0.6, 0.8], wfs)
+    assert wf.iscomplex
+    configs = pyq.initial_guess(mol, nconf)
+    run_tests(wf, configs, epsilon)